@@ -0,0 +1,28 @@
+"""Build script, optionally compiling the conversion modules with Cython.
+
+Set `XSDTOPYDANTIC_CYTHONIZE=1` when building to compile `api.py`, `xsd.py` and
+`converter.py` into extension modules.
+"""
+import os
+
+from setuptools import setup
+
+CYTHON_MODULES = [
+    "xsdtopydantic/api.py",
+    "xsdtopydantic/xsd.py",
+    "xsdtopydantic/converter.py",
+]
+
+options = {}
+if os.environ.get("XSDTOPYDANTIC_CYTHONIZE") == "1":
+    try:
+        from Cython.Build import cythonize
+    except ImportError:
+        # Requested from the build backend, which will then rerun this script.
+        options["setup_requires"] = ["Cython>=3"]
+    else:
+        options["ext_modules"] = cythonize(
+            CYTHON_MODULES, compiler_directives={"language_level": 3}
+        )
+
+setup(**options)
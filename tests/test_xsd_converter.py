@@ -1,5 +1,93 @@
+import json
+import tempfile
+
+import pytest
+
 from xsdtopydantic import converter, utils
 
+READER_SCHEMA = """<?xml version="1.0"?>
+<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns="urn:test">
+    <xsd:annotation>
+        <xsd:documentation xml:lang="en">A schema.</xsd:documentation>
+    </xsd:annotation>
+    <xsd:element name="root" type="rootType"/>
+    <xsd:complexType name="rootType">
+        <!-- A comment -->
+        <xsd:sequence>
+            <xsd:element name="child" type="xsd:string" maxOccurs="unbounded"/>
+        </xsd:sequence>
+    </xsd:complexType>
+</xsd:schema>
+"""
+
+LIBRARY_SCHEMA = """<?xml version="1.0"?>
+<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns="http://example.com"
+    targetNamespace="http://example.com">
+    <xsd:annotation>
+        <xsd:documentation>A library.</xsd:documentation>
+    </xsd:annotation>
+    <xsd:element name="library" type="LibraryType"/>
+    <xsd:complexType name="ItemType">
+        <xsd:sequence>
+            <xsd:element name="tag" type="xsd:string" maxOccurs="unbounded"/>
+        </xsd:sequence>
+    </xsd:complexType>
+    <xsd:complexType name="BookType">
+        <xsd:complexContent>
+            <xsd:extension base="ItemType">
+                <xsd:sequence>
+                    <xsd:element name="author" type="xsd:string" maxOccurs="unbounded"/>
+                </xsd:sequence>
+            </xsd:extension>
+        </xsd:complexContent>
+    </xsd:complexType>
+    <xsd:complexType name="SectionType">
+        <xsd:sequence>
+            <xsd:element name="book" type="BookType" maxOccurs="unbounded"/>
+            <xsd:element name="section" type="SectionType" minOccurs="0" maxOccurs="unbounded"/>
+        </xsd:sequence>
+    </xsd:complexType>
+    <xsd:complexType name="LibraryType">
+        <xsd:sequence>
+            <xsd:element name="section" type="SectionType" maxOccurs="unbounded"/>
+        </xsd:sequence>
+    </xsd:complexType>
+</xsd:schema>
+"""
+
+LIBRARY = """<?xml version="1.0"?>
+<library xmlns="http://example.com">
+    <section>
+        <book><tag>a</tag><author>b</author></book>
+        <section>
+            <book><tag>c</tag><author>d</author></book>
+        </section>
+    </section>
+</library>
+"""
+
+FLAT_SCHEMA = """<?xml version="1.0"?>
+<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns="http://example.com"
+    targetNamespace="http://example.com">
+    <xsd:element name="root" type="rootType"/>
+    <xsd:complexType name="rootType">
+        <xsd:sequence>
+            <xsd:element name="child" type="childType"/>
+        </xsd:sequence>
+    </xsd:complexType>
+    <xsd:complexType name="childType">
+        <xsd:attribute name="name" type="xsd:string"/>
+    </xsd:complexType>
+</xsd:schema>
+"""
+
+
+def _write(tmp_path, text: str, name: str = "schema.xsd") -> str:
+    """Write a file in the test's directory, returning its path."""
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
 
 def tcx_test():
     """Test that we can read TCX file from the converted model."""
@@ -19,9 +107,95 @@ def gpx_test():
         module.Document.from_xml("https://www.topografix.com/fells_loop.gpx")
 
 
+def from_xml_test(tmp_path):
+    """Test reading a local file from the converted model."""
+    schema_path = _write(tmp_path, LIBRARY_SCHEMA)
+    path = _write(tmp_path, LIBRARY, "library.xml")
+    with utils.module_from_script(converter.convert(schema_path)) as module:
+        assert module.Document.__doc__ == "A library."
+        document = module.Document.from_xml(path)
+    # Each element occurs once, but is unbounded so should still be a list.
+    (section,) = document.library.section
+    (book,) = section.book
+    assert book.tag == ["a"] and book.author == ["b"]
+    (nested,) = section.section
+    (book,) = nested.book
+    assert book.tag == ["c"] and book.author == ["d"]
+
+
+def max_depth_test(tmp_path):
+    """Test that recursive types are only expanded until max_depth."""
+    path = _write(tmp_path, LIBRARY_SCHEMA)
+    with utils.module_from_script(converter.convert(path, max_depth=4)) as module:
+        assert module.Document.__force_list__ == {
+            "library": {
+                "section": {
+                    None: True,
+                    "book": {None: True},
+                    "section": {None: True},
+                }
+            }
+        }
+
+
+def to_xml_test(tmp_path):
+    """Test that a model without any sequences can be written back out."""
+    path = _write(tmp_path, FLAT_SCHEMA)
+    with utils.module_from_script(converter.convert(path)) as module:
+        document = module.Document(root={"child": {"@name": "a"}})
+        assert '<child name="a">' in document.to_xml()
+
+
+def read_xsd_file_test(tmp_path):
+    """Test that the ElementTree reader matches the xmltodict reader."""
+    # The others bind XMLSchema to both xs and xsd, declare a namespace below
+    # the root, and put an attribute before the namespace declarations.
+    for schema in (
+        READER_SCHEMA,
+        READER_SCHEMA.replace(
+            'xmlns="urn:test"',
+            'xmlns="urn:test" xmlns:xs="http://www.w3.org/2001/XMLSchema"',
+        ).replace('<xsd:element name="root"', '<xs:element name="root"'),
+        READER_SCHEMA.replace(
+            '<xsd:element name="root"', '<xsd:element xmlns:t="urn:t" name="root"'
+        ),
+        READER_SCHEMA.replace("<xsd:schema", '<xsd:schema targetNamespace="urn:test"'),
+    ):
+        path = _write(tmp_path, schema)
+        # Compare as JSON, so that the order of the keys is checked too.
+        assert json.dumps(utils.read_xsd_file(path)) == json.dumps(
+            utils.read_file(path)
+        )
+
+
+def read_xsd_file_entities_test(tmp_path):
+    """Test that both readers reject entity declarations."""
+    path = _write(
+        tmp_path,
+        READER_SCHEMA.replace(
+            "<xsd:schema",
+            '<!DOCTYPE xsd:schema [<!ENTITY e "A schema.">]>\n<xsd:schema',
+            1,
+        ).replace("A schema.</", "&e;</"),
+    )
+    for reader in (utils.read_file, utils.read_xsd_file):
+        with pytest.raises(ValueError, match="entities are disabled"):
+            reader(path)
+
+
+def cache_test(tmp_path, monkeypatch):
+    """Test that converting from the cache matches converting from the XSD."""
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    path = _write(tmp_path, LIBRARY_SCHEMA)
+    expected = converter.convert(path)
+    assert converter.convert(path, cache=True) == expected
+    (cache_dir,) = tmp_path.glob("xsdtopydantic-*")
+    assert cache_dir.stat().st_mode & 0o777 == 0o700
+    assert len(list(cache_dir.glob("*.json"))) == 1
+    assert converter.convert(path, cache=True) == expected
+
+
 if __name__ == "__main__":
     import sys
 
-    import pytest
-
     sys.exit(pytest.main(["-v", "-s"] + sys.argv))
@@ -1,4 +1,5 @@
 """Abstract classes for convertable elements."""
+
 import abc
 import dataclasses
 from typing import Mapping
@@ -18,17 +19,39 @@ class ConverterState:
     simple_types: dict[str, str] = dataclasses.field(default_factory=dict)
 
     typing_imports: set[str] = dataclasses.field(default_factory=set)
+    needs_optional: bool = False
     imports: set[str] = dataclasses.field(default_factory=lambda: {"pydantic"})
 
     abstract_classes: dict[str, str] = dataclasses.field(default_factory=dict)
     classes: dict[str, str] = dataclasses.field(default_factory=dict)
 
+    class_bases: dict[str, str] = dataclasses.field(default_factory=dict)
+    class_children: dict[str, list[tuple[str, str]]] = dataclasses.field(
+        default_factory=dict
+    )
+    array_paths: set[tuple[str, ...]] = dataclasses.field(default_factory=set)
+
     _in_complex: bool = False
+    _base_type_cache: dict[
+        tuple[str, bool], tuple[str, str | None, bool]
+    ] = dataclasses.field(default_factory=dict)
+    _enclosing_class: str = "Document"
+
+
+def _function():
+    """Do nothing, but expose the type of functions in this build."""
+
+
+# When compiled with Cython, methods are not plain functions so pydantic needs
+# to be told to ignore them rather than treating them as fields.
+FUNCTION_TYPES = (type(_function),)
 
 
 class Convertable(abc.ABC, pydantic.BaseModel):
     """Interface for a compilable BaseModel."""
 
+    model_config = pydantic.ConfigDict(ignored_types=FUNCTION_TYPES, defer_build=True)
+
     @abc.abstractmethod
     def _convert(self, state: ConverterState) -> str:
         """Convert this element in to the representation required for pydantic."""
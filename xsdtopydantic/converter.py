@@ -1,113 +1,144 @@
 """Main module containing the converter."""
 
 
+import collections
 from types import MappingProxyType
-from typing import Any, cast
-
-import pydantic
+from typing import Any
 
 from xsdtopydantic import api, utils, xsd
 
 
-def _find_arrays(
-    model: type[pydantic.BaseModel], max_depth: int
-) -> set[tuple[str, ...]]:
-    """Find all the arrays in a pydantic model.
+def _expand_arrays(state: api.ConverterState, max_depth: int) -> set[tuple[str, ...]]:
+    """Expand the arrays found whilst compiling into paths from the document root.
 
-    You may need to limit max_depth to prevent max_recursion.
+    Recursive types are only expanded until the paths reach max_depth.
     """
 
-    def iterate(path: tuple[str, ...], props: dict[str, Any]):
-        if len(path) >= max_depth:
-            return
-        if "anyOf" not in props:
-            if props["type"] == "array":
-                arrays.add(path)
-                if (defintion := props["items"].get("$ref", None)) is None:
-                    return
-                for child, child_props in definitions[defintion[8:]][
-                    "properties"
-                ].items():
-                    iterate(path + (child,), child_props)
-
-            return
-        for type in props["anyOf"]:
-            if (defintion := type.get("$ref", None)) is None:
-                continue
-            for child, child_props in definitions[defintion[8:]]["properties"].items():
-                iterate(path + (child,), child_props)
+    def children(cls: str):
+        while cls in state.class_children or cls in state.class_bases:
+            for name, type in state.class_children.get(cls, ()):
+                yield cls, name, type
+            if (base := state.class_bases.get(cls, None)) is None:
+                return
+            cls = base
 
-    schema = model.model_json_schema()
-    definitions = schema["$defs"]
     arrays: set[tuple[str, ...]] = set()
-    for root, props in schema["properties"].items():
-        iterate((root,), props)
+    queue: collections.deque[tuple[tuple[str, ...], str]] = collections.deque(
+        [((), "Document")]
+    )
+    while queue:
+        path, cls = queue.popleft()
+        for owner, name, type in children(cls):
+            child_path = path + (name,)
+            if len(child_path) >= max_depth:
+                continue
+            if (owner, name) in state.array_paths:
+                arrays.add(child_path)
+            if type in state.class_children or type in state.class_bases:
+                queue.append((child_path, type))
     return arrays
 
 
-def convert(path: str, output_path: str | None = None, max_depth: int = 16):
-    """Convert an XSD document into a PyDantic schema."""
-    data = utils.read_file(path=path)
-    if "xsd:schema" not in data:
-        raise ValueError("Root node not present, this does not look like an XSD file.")
+def convert(
+    path: str,
+    output_path: str | None = None,
+    max_depth: int = 16,
+    cache: bool = False,
+):
+    """Convert an XSD document into a PyDantic schema.
 
-    root = data["xsd:schema"]
-    tmp_data = xsd.XSD(**root)
-    xsd_data = {k: v for k, v in root.items() if k.startswith("@")}
+    If cache is True, the parsed XSD is stored in a private directory under the
+    temporary directory and reused by later conversions of the same path. Remote
+    schemas are fetched again once their entry is older than `utils.CACHE_EXPIRY`.
+    """
+    if cache and (cached := utils.read_cache(path)) is not None:
+        xsd_data, root_json = cached
+        tmp_data = xsd.XSD_ADAPTER.validate_json(root_json)
+    else:
+        data = utils.read_xsd_file(path=path)
+        if "xsd:schema" not in data:
+            raise ValueError(
+                "Root node not present, this does not look like an XSD file."
+            )
+
+        root = data["xsd:schema"]
+        tmp_data = xsd.XSD_ADAPTER.validate_python(root)
+        xsd_data = {k: v for k, v in root.items() if k.startswith("@")}
+        if cache:
+            utils.write_cache(path, xsd_data, root)
     state = tmp_data.compile(api.ConverterState(MappingProxyType(xsd_data)))
-    output = ""
+    parts: list[str] = []
 
-    for imp in sorted(
-        tuple(state.imports) + ("urllib.request", "typing.*", "xmltodict")
-    ):
+    # Document.to_xml always refers to Sequence.
+    state.typing_imports.add("Sequence")
+    if state.needs_optional:
+        state.typing_imports.add("Optional")
+    for imp in sorted(tuple(state.imports) + ("urllib3", "typing.*", "xmltodict")):
         if imp == "typing.*" and state.typing_imports:
-            output += (
+            parts.append(
                 f"from typing import {', '.join(sorted(list(state.typing_imports)))}\n"
             )
             continue
-        output += f"import {imp}\n"
-    output += "\n"
+        parts.append(f"import {imp}\n")
+    parts.append("\n_POOL = urllib3.PoolManager()\n\n")
     for cls in state.base_type_aliases.keys():
         if (prioritized_type := state.simple_types.pop(cls, None)) is not None:
-            output += prioritized_type + "\n"
+            parts.append(prioritized_type + "\n")
     for cls in state.simple_types.values():
-        output += cls + "\n"
+        parts.append(cls + "\n")
     if state.simple_types:
-        output += "\n"
+        parts.append("\n")
     for cls in state.abstract_classes.values():
-        output += cls + "\n"
+        parts.append(cls + "\n")
     if state.abstract_classes:
-        output += "\n"
+        parts.append("\n")
     for cls in state.classes.values():
-        output += cls + "\n"
+        parts.append(cls + "\n")
 
     if state.classes:
-        output += "\n"
+        parts.append("\n")
+
+    parts.append(
+        f"""class Document(pydantic.BaseModel):
+\t\"\"\"{state.root_annotation}\"\"\"
 
-    output += f'\t"""{state.root_annotation}"""\n'
-    output += f"""class Document(pydantic.BaseModel):\n
 \t__xsd_data__ = {
             xsd_data
         }
 \n"""
+    )
+    force_list: dict[str | None, Any] = {}
+    for array in sorted(_expand_arrays(state, max_depth=max_depth)):
+        node = force_list
+        for segment in array:
+            node = node.setdefault(segment, {})
+        node[None] = True
+    parts.append(f"\t__force_list__ = {force_list}\n\n")
     for attr in state.document_attributes.values():
-        output += f"\t{attr}\n"
-    with utils.module_from_script(output) as module:
-        current_schema = cast(type[pydantic.BaseModel], module.Document)
-        arrays = _find_arrays(current_schema, max_depth=max_depth)
-    output += (
+        parts.append(f"\t{attr}\n")
+    parts.append(
         f"""\t@staticmethod\n\tdef from_xml(path: str)->'Document':
 		\"\"\"Read a file as a document.\"\"\"
-		force_list = {arrays}
-		string: str
+
+		def force_list(path, key, _) -> bool:
+			node = Document.__force_list__
+			for parent, _attributes in path:
+				if (node := node.get(parent, None)) is None:
+					return False
+			return None in node.get(key, ())
+
+		string: str | bytes
 		if path.startswith("http"):
-			string = urllib.request.urlopen(path)
+			response = _POOL.request("GET", path)
+			if response.status >= 400:
+				raise OSError(f"Could not read {{path}}, HTTP status {{response.status}}.")
+			string = response.data
 		else:
 			with open(path, "r") as fp:
 				string = fp.read()
 		return Document(**xmltodict.parse(
 			string,
-			force_list=lambda path, key, _:(tuple(p[0] for p in path) + (key,) in force_list)
+			force_list=force_list
 		))
 	
 	def to_xml(
@@ -137,6 +168,7 @@ def convert(path: str, output_path: str | None = None, max_depth: int = 16):
 		return output
 """
     )
+    output = "".join(parts)
     if output_path is not None:
         with open(output_path, "w") as fp:
             fp.write(output)
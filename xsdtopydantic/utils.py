@@ -1,19 +1,37 @@
 """Utility functions for the converter."""
 import contextlib
-import importlib
-import importlib.util
+import functools
+import hashlib
+import json
+import os
 import random
 import re
+import stat
 import sys
 import tempfile
+import time
+import types
 import typing
-import urllib.request
+from xml.etree import ElementTree  # nosec B405 - expat rejects entities
+from xml.parsers import expat
 
+import urllib3
 import xmltodict
 
+import xsdtopydantic
+
+_POOL = urllib3.PoolManager()
 SNAKE_CASE_PATTERN = re.compile(r"(?<!^)(?=[A-Z])")
+XSD_FORCE_LIST = (
+    "xsd:element",
+    "xsd:attribute",
+    "xsd:enumeration",
+)
+CACHE_EXPIRY = 24 * 60 * 60
+"""How long, in seconds, a cached remote schema is reused for."""
 
 
+@functools.lru_cache(maxsize=None)
 def snake_case(camel_case: str):
     """Convert camelCase to snake_case."""
     return SNAKE_CASE_PATTERN.sub("_", camel_case).lower()
@@ -26,33 +44,198 @@ def module_from_script(script: str):
     module_name = f"tmp_{random.getrandbits(128):032x}"
     while module_name in sys.modules:
         module_name = f"tmp_{random.getrandbits(128):032x}"
-    with tempfile.NamedTemporaryFile("r", suffix=".py") as tmp_file:
-        file_path = tmp_file.name
-        with open(file_path, "w") as fp:
-            fp.write(script)
-        spec = importlib.util.spec_from_file_location(module_name, file_path)
-        module = importlib.util.module_from_spec(spec)
-        try:
-            sys.modules[module_name] = module
-            spec.loader.exec_module(module)
-            yield __import__(module_name)
-        finally:
-            del sys.modules[module_name]
+    module = types.ModuleType(module_name)
+    try:
+        sys.modules[module_name] = module
+        exec(compile(script, f"<{module_name}>", "exec"), module.__dict__)  # nosec B102
+        yield module
+    finally:
+        del sys.modules[module_name]
+
+
+@contextlib.contextmanager
+def _open(path: str) -> typing.Iterator[typing.IO[bytes]]:
+    """Open a local or remote file as a binary stream."""
+    if not path.startswith("http"):
+        with open(path, "rb") as fp:
+            yield fp
+        return
+    response = _POOL.request("GET", path, preload_content=False)
+    try:
+        if response.status >= 400:
+            raise OSError(f"Could not read {path}, HTTP status {response.status}.")
+        yield typing.cast(typing.IO[bytes], response)
+    finally:
+        # Only a fully read connection can go back to the pool.
+        response.drain_conn()
+        response.release_conn()
+
+
+def _forbid_entities(*_):
+    """Reject entity declarations, as xmltodict does."""
+    raise ValueError("entities are disabled")
 
 
 def read_file(path: str):
     """Read a file."""
-    string: str
-    if path.startswith("http"):
-        string = urllib.request.urlopen(path)  # nosec B310
-    else:
-        with open(path, "r") as fp:
-            string = fp.read()
-    return xmltodict.parse(
-        string,
-        force_list=(
-            "xsd:element",
-            "xsd:attribute",
-            "xsd:enumeration",
-        ),
+    with _open(path) as fp:
+        return xmltodict.parse(fp, force_list=XSD_FORCE_LIST)
+
+
+def read_xsd_file(path: str):
+    """Read an XSD file, using ElementTree to parse it.
+
+    The output matches `read_file`, except that attribute values are interned.
+    ElementTree expands entities and drops namespace declarations, so the prolog
+    and root element are also run through expat, which rejects any entity
+    declaration and keeps the root attributes as written. Files that declare
+    namespaces below the root, or bind a namespace to more than one prefix, are
+    parsed with xmltodict instead.
+    """
+    names = {"http://www.w3.org/XML/1998/namespace": "xml"}
+
+    def qualified_name(tag: str) -> str:
+        if tag[0] != "{":
+            return tag
+        namespace, local_name = tag[1:].split("}", 1)
+        if prefix := names.get(namespace, ""):
+            return f"{prefix}:{local_name}"
+        return local_name
+
+    def to_dict(
+        element: ElementTree.Element, attributes: typing.Iterable[tuple[str, str]]
+    ):
+        output: dict[str, typing.Any] = {}
+        for key, value in attributes:
+            # Names and types repeat throughout a schema, so share one string.
+            output[f"@{qualified_name(key)}"] = sys.intern(value)
+        text = [element.text or ""]
+        for child in element:
+            text.append(child.tail or "")
+            name = qualified_name(child.tag)
+            value = to_dict(child, child.attrib.items())
+            if name not in output:
+                output[name] = [value] if name in XSD_FORCE_LIST else value
+            elif isinstance(output[name], list):
+                output[name].append(value)
+            else:
+                output[name] = [output[name], value]
+        if data := "".join(text).strip():
+            if not output:
+                return data
+            output["#text"] = data
+        return output or None
+
+    root_attributes: list[str] | None = None
+
+    def start_root(_name: str, attributes: list[str]) -> None:
+        nonlocal root_attributes
+        if root_attributes is None:
+            root_attributes = attributes
+
+    checker = expat.ParserCreate()
+    checker.ordered_attributes = True
+    checker.EntityDeclHandler = _forbid_entities
+    checker.StartElementHandler = start_root
+    parser: ElementTree.XMLPullParser[ElementTree.Element] = ElementTree.XMLPullParser(
+        events=("start-ns", "start")
     )
+    root: ElementTree.Element | None = None
+    namespaces: list[tuple[str, str]] = []
+    nested_namespaces = False
+    # Kept in case the file has to be handed to xmltodict instead.
+    chunks: list[bytes] = []
+    with _open(path) as fp:
+        for chunk in iter(functools.partial(fp.read, 1 << 16), b""):
+            chunks.append(chunk)
+            # Entities can only be declared before the root element.
+            if root_attributes is None:
+                checker.Parse(chunk)
+            parser.feed(chunk)
+            # Only start-ns and start events are requested, which are all pairs.
+            events = typing.cast(
+                typing.Iterator[tuple[str, typing.Any]], parser.read_events()
+            )
+            for event, item in events:
+                if event == "start-ns":
+                    namespaces.append(typing.cast(tuple[str, str], item))
+                    nested_namespaces |= root is not None
+                elif root is None:
+                    root = typing.cast(ElementTree.Element, item)
+    parser.close()
+    if root is None or root_attributes is None:
+        raise ValueError("No root element found.")
+    names.update((namespace, prefix) for prefix, namespace in namespaces)
+    # ElementTree drops which prefix was written, so it can't always be recovered.
+    if nested_namespaces or len(names) != len(namespaces) + 1:
+        return xmltodict.parse(b"".join(chunks), force_list=XSD_FORCE_LIST)
+    attributes = zip(root_attributes[::2], root_attributes[1::2])
+    return {qualified_name(root.tag): to_dict(root, attributes)}
+
+
+def _cache_dir() -> str:
+    """Get the cache directory, which is private to the current user."""
+    if not hasattr(os, "getuid"):
+        # The temporary directory is already per-user where there are no uids.
+        directory = os.path.join(tempfile.gettempdir(), "xsdtopydantic")
+        os.makedirs(directory, exist_ok=True)
+        return directory
+    directory = os.path.join(tempfile.gettempdir(), f"xsdtopydantic-{os.getuid()}")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or stat.S_IMODE(info.st_mode) & 0o077
+    ):
+        raise OSError(
+            f"Refusing to use {directory} as a cache, it is not private to this user."
+        )
+    return directory
+
+
+def _cache_path(path: str) -> str:
+    """Get the location of the cached schema for a path.
+
+    Local files are keyed by their modification time as well as their path.
+    """
+    key = path
+    if not path.startswith("http"):
+        key = f"{os.path.abspath(path)}:{os.path.getmtime(path)}"
+    key = f"{xsdtopydantic.__version__}:{key}"
+    digest = hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+    return os.path.join(_cache_dir(), f"{digest}.json")
+
+
+def read_cache(path: str) -> tuple[dict[str, str], bytes] | None:
+    """Read the cached root attributes and root node (as JSON) of a schema.
+
+    Entries must be owned by the current user, and remote entries expire after
+    CACHE_EXPIRY seconds.
+    """
+    cache_path = _cache_path(path)
+    try:
+        info = os.lstat(cache_path)
+    except FileNotFoundError:
+        return None
+    if (
+        not stat.S_ISREG(info.st_mode)
+        or (hasattr(os, "getuid") and info.st_uid != os.getuid())
+        or (path.startswith("http") and time.time() - info.st_mtime >= CACHE_EXPIRY)
+    ):
+        return None
+    with open(cache_path, "rb") as fp:
+        return json.loads(fp.readline()), fp.read()
+
+
+def write_cache(path: str, xsd_data: dict[str, str], root: dict[str, typing.Any]):
+    """Cache the root attributes and root node of a schema.
+
+    They are stored on separate lines, so the root node can be validated straight
+    from JSON.
+    """
+    cache_path = _cache_path(path)
+    tmp_path = f"{cache_path}.{os.getpid()}"
+    with open(tmp_path, "w") as fp:
+        fp.write(f"{json.dumps(xsd_data)}\n{json.dumps(root)}")
+    os.replace(tmp_path, cache_path)
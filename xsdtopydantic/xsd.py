@@ -1,5 +1,8 @@
 """Schematics for XSD elements."""
+
 import dataclasses
+import sys
+import textwrap
 from types import MappingProxyType
 from typing import Literal, Mapping, Sequence
 
@@ -7,40 +10,52 @@ import pydantic
 
 from xsdtopydantic import api, utils
 
+_TYPES: dict[str, str | tuple[str, ...]] = {
+    "xsd:double": "float",
+    "xsd:integer": "int",
+    "xsd:float": "float",
+    "xsd:decimal": "float",
+    "xsd:anyURI": "pydantic.AnyUrl",
+    "xsd:token": "str",
+    "xsd:positiveInteger": ("int", "annotated_types.Gt(0)"),
+    "xsd:unsignedByte": (
+        "int",
+        f"annotated_types.Ge(0), annotated_types.Lt({2**8})",
+    ),
+    "xsd:string": "str",
+    "xsd:dateTime": "datetime.datetime",
+    "xsd:date": "datetime.date",
+    "xsd:unsignedShort": (
+        "int",
+        f"annotated_types.Ge(0), annotated_types.Lt({2**16})",
+    ),
+    "xsd:unsignedInt": (
+        "int",
+        f"annotated_types.Ge(0), annotated_types.Lt({2**32})",
+    ),
+    "xsd:nonNegativeInteger": (
+        "int",
+        f"annotated_types.Ge(0)",
+    ),
+    "xsd:boolean": "bool",
+    "xsd:gYear": (
+        "str",
+        r'pydantic.constr(pattern=r"^[-]?\d{4,}(?:Z|[+-]{1}\d{2}[:]?\d{2})?$")',
+    ),
+}
+# The keys are interned to match the attribute values from `utils.read_xsd_file`,
+# so lookups compare by identity. Schemas loaded from the cache are not interned.
 TYPES: Mapping[str, str | tuple[str, ...]] = MappingProxyType(
-    {
-        "xsd:double": "float",
-        "xsd:integer": "int",
-        "xsd:float": "float",
-        "xsd:decimal": "float",
-        "xsd:anyURI": "pydantic.AnyUrl",
-        "xsd:token": "str",
-        "xsd:positiveInteger": ("int", "annotated_types.Gt(0)"),
-        "xsd:unsignedByte": (
-            "int",
-            f"annotated_types.Ge(0), annotated_types.Lt({2**8})",
-        ),
-        "xsd:string": "str",
-        "xsd:dateTime": "datetime.datetime",
-        "xsd:date": "datetime.date",
-        "xsd:unsignedShort": (
-            "int",
-            f"annotated_types.Ge(0), annotated_types.Lt({2**16})",
-        ),
-        "xsd:unsignedInt": (
-            "int",
-            f"annotated_types.Ge(0), annotated_types.Lt({2**32})",
-        ),
-        "xsd:nonNegativeInteger": (
-            "int",
-            f"annotated_types.Ge(0)",
-        ),
-        "xsd:boolean": "bool",
-        "xsd:gYear": (
-            "str",
-            r'pydantic.constr(pattern=r"^[-]?\d{4,}(?:Z|[+-]{1}\d{2}[:]?\d{2})?$")',
-        ),
-    }
+    {sys.intern(name): base_type for name, base_type in _TYPES.items()}
+)
+
+RESTRICTION_RULES: Sequence[tuple[str, str]] = (
+    ("pattern", 'pydantic.constr(pattern=r"{}")'),
+    ("length", "pydantic.constr(min_length={0}, max_length={0})"),
+    ("max_length", "pydantic.constr(max_length={})"),
+    ("min_length", "pydantic.constr(min_length={})"),
+    ("max_inclusive", "annotated_types.Le({})"),
+    ("min_inclusive", "annotated_types.Ge({})"),
 )
 
 
@@ -64,7 +79,7 @@ class XSDAttribute(api.Convertable):
 
     def _convert(self, state: api.ConverterState) -> str:
         alias = utils.snake_case(self.name)
-        type, _ = _base_type(self.name, self.type, state)
+        type, *_ = _base_type(self.name, self.type, state)
         # TODO @use
         return f'{alias}: {type} = pydantic.Field(alias="@{self.name}")'
 
@@ -75,16 +90,21 @@ class XSDElement(api.Convertable):
     name: str = pydantic.Field(alias="@name")
     type: str = pydantic.Field(alias="@type")
     min_occurs: int | None = pydantic.Field(alias="@minOccurs", default=None)
-    max_occurs: int | None | Literal["unbounded"] = pydantic.Field(
-        alias="@maxOccurs", default=None
+    max_occurs: Literal["unbounded"] | int | None = pydantic.Field(
+        alias="@maxOccurs", default=None, union_mode="left_to_right"
     )
     annotation: XSDAnnotation | None = pydantic.Field(
         alias="xsd:annotation", default=None
     )
 
     def _convert(self, state: api.ConverterState) -> str:
-        type, _ = _base_type(self.name, self.type, state)
-        if type not in state.classes and TYPES.get(self.type, None) is None:
+        state.class_children.setdefault(state._enclosing_class, []).append(
+            (self.name, self.type)
+        )
+        if self.max_occurs == "unbounded":
+            state.array_paths.add((state._enclosing_class, self.name))
+        type, _, is_forward_ref = _base_type(self.name, self.type, state)
+        if is_forward_ref:
             type = f"'{type}'"
         name = self.name
         alias = utils.snake_case(self.name)
@@ -93,22 +113,21 @@ class XSDElement(api.Convertable):
 
         if self.max_occurs == "unbounded":
             type = f"Sequence[{type}]"
-            state.typing_imports.add("Sequence")
-            # TODO force list
         if not self.min_occurs:
+            parts: list[str]
             if self.max_occurs == "unbounded":
-                type += f" = pydantic.Field(default_factory=tuple"
+                parts = [type, " = pydantic.Field(default_factory=tuple"]
+            elif is_forward_ref:
+                state.needs_optional = True
+                parts = ["Optional[", type, "] = pydantic.Field(default=None"]
             else:
-                if type.endswith("'"):
-                    state.typing_imports.add("Optional")
-                    type = "Optional[" + type + f"] = pydantic.Field(default=None"
-                else:
-                    type += f" | None = pydantic.Field(default=None"
+                parts = [type, " | None = pydantic.Field(default=None"]
             if alias:
-                type += f', alias="{(name)}"'
+                parts.append(f', alias="{(name)}"')
                 name = alias
                 alias = None
-            type += ")"
+            parts.append(")")
+            type = "".join(parts)
 
         annotation = _docstring(self.annotation, state, multiline=False)
         if alias:
@@ -127,12 +146,12 @@ class XSDSequence(api.Convertable):
     )
 
     def _convert(self, state: api.ConverterState) -> str:
-        output = _docstring(self.annotation, state, True)
-        if output:
-            output += "\n"
+        lines: list[str] = []
+        if docstring := _docstring(self.annotation, state, True):
+            lines.append(docstring)
         for element in self.elements:
-            output += f"{element._convert(state)}\n"
-        return output
+            lines.append(element._convert(state))
+        return "\n".join(lines)
 
 
 class XSDExtension(api.Convertable):
@@ -173,30 +192,30 @@ class XSDComplexType(api.Convertable):
     )
 
     def _convert(self, state: api.ConverterState) -> str:
-        output = f"class {self.name}("
+        state._enclosing_class = self.name
+        parts = [f"class {self.name}("]
         if self.complex_content:
-            output += self.complex_content.extension.base
+            base = self.complex_content.extension.base
+            state.class_bases[self.name] = base
+            parts.append(base)
         else:
-            output += "pydantic.BaseModel"
+            parts.append("pydantic.BaseModel")
         if self.abstract:
             state.imports.add("abc")
-            output += ", abc.ABC"
+            parts.append(", abc.ABC")
 
-        output += "):\n"
+        parts.append("):\n")
+        body: list[str] = []
         if docstring := _docstring(self.annotation, state, True):
-            output += f"\t{docstring}\n"
-        if self.sequence:
-            output += "\t" + ("\n\t".join(self.sequence._convert(state).splitlines()))
-        elif self.complex_content:
-            output += "\t" + (
-                "\n\t".join(self.complex_content._convert(state).splitlines())
-            )
-
+            body.append(docstring)
+        content = self.sequence or self.complex_content
+        if content and (converted_content := content._convert(state)):
+            body.append(converted_content)
         for attribute in self.attributes:
-            output += f"\n\t{attribute._convert(state)}"
-        if output.rstrip()[-1] == ":":
-            output = output.rstrip() + "\n\t...\n"
-        return output + "\n"
+            body.append(attribute._convert(state))
+        parts.append(textwrap.indent("\n".join(body or ["..."]), "\t"))
+        parts.append("\n")
+        return "".join(parts)
 
 
 class XSDRestriction(api.Convertable):
@@ -260,21 +279,13 @@ class XSDRestriction(api.Convertable):
         return tuple(w["@value"] for w in v)
 
     def _convert(self, state: api.ConverterState) -> str:
-        rules = []
-        if (pattern := self.pattern) is not None:
-            rules.append(rf"""pydantic.constr(pattern=r"{pattern}")""")
-        if (length := self.length) is not None:
-            rules.append(f"pydantic.constr(min_length={length}, max_length={length})")
-        if (max_length := self.max_length) is not None:
-            rules.append(f"pydantic.constr(max_length={max_length})")
-        if (min_length := self.min_length) is not None:
-            rules.append(f"pydantic.constr(min_length={min_length})")
-        if (max_inclusive := self.max_inclusive) is not None:
-            state.imports.add("annotated_types")
-            rules.append(f"annotated_types.Le({max_inclusive})")
-        if (min_inclusive := self.min_inclusive) is not None:
+        rules = [
+            template.format(value)
+            for field, template in RESTRICTION_RULES
+            if (value := getattr(self, field)) is not None
+        ]
+        if self.max_inclusive is not None or self.min_inclusive is not None:
             state.imports.add("annotated_types")
-            rules.append(f"annotated_types.Ge({min_inclusive})")
         return ", ".join(rules) if rules else "None"
 
 
@@ -291,7 +302,7 @@ class XSDSimpleType(api.Convertable):
             base_type = f"Literal{list(literal)}"
             state.typing_imports.add("Literal")
         else:
-            base_type, rule = _base_type(self.name, self.restriction.base, state)
+            base_type, rule, _ = _base_type(self.name, self.restriction.base, state)
         type_annotation = self.restriction._convert(state)
         state.typing_imports.add("TypeAlias")
         state.typing_imports.add("Annotated")
@@ -301,6 +312,10 @@ class XSDSimpleType(api.Convertable):
 class XSD(pydantic.BaseModel):
     """Model for XSD document."""
 
+    model_config = pydantic.ConfigDict(
+        ignored_types=api.FUNCTION_TYPES, defer_build=True
+    )
+
     xmlns: pydantic.HttpUrl | None = pydantic.Field(alias="@xmlns")
     xmlns_xsd: str | pydantic.HttpUrl = pydantic.Field(alias="@xmlns:xsd")
     target_namespace: str | pydantic.HttpUrl = pydantic.Field(alias="@targetNamespace")
@@ -332,6 +347,7 @@ class XSD(pydantic.BaseModel):
                 type.name
             ] = type._convert(state)
         state._in_complex = False
+        state._enclosing_class = "Document"
         for element in self.elements:
             state.document_attributes[element.name] = element._convert(state)
         for simple_type in self.simple_types:
@@ -339,34 +355,53 @@ class XSD(pydantic.BaseModel):
         return state
 
 
-def _base_type(name: str, type: str, state: api.ConverterState):
-    """Find the basetype, updating the state with new aliases."""
+XSD_ADAPTER: pydantic.TypeAdapter[XSD] = pydantic.TypeAdapter(XSD)
+
+
+def _base_type(
+    name: str, type: str, state: api.ConverterState
+) -> tuple[str, str | None, bool]:
+    """Find the basetype, updating the state with new aliases.
+
+    The final value is whether the basetype needs to be a forward reference.
+    """
+    key = (type, state._in_complex)
+    if (resolved := state._base_type_cache.get(key, None)) is None:
+        resolved = state._base_type_cache[key] = _resolve_base_type(type, state)
+    base_type, rule, is_alias = resolved
+    if is_alias:
+        state.base_type_aliases[name] = base_type
+    return base_type, rule, not is_alias and base_type not in state.classes
+
+
+def _resolve_base_type(
+    type: str, state: api.ConverterState
+) -> tuple[str, str | None, bool]:
+    """Resolve the basetype of a type, registering any simple types it needs.
+
+    The final value is whether the type was found in `TYPES`.
+    """
     base_type = TYPES.get(type, dataclasses.MISSING)
     rule = None
+    is_alias = base_type is not dataclasses.MISSING
     if base_type is dataclasses.MISSING:
         base_type = type
-    else:
-        if isinstance(base_type, tuple):
-            base_type, rule = base_type
-            if state._in_complex and type.startswith("xsd:"):
-                new_type: str
-                state.simple_types[new_type] = (
-                    XSDSimpleType.model_validate(
-                        {
-                            "@name": (new_type := type[4:]),
-                            "xsd:restriction": XSDRestriction.model_validate(
-                                {"@base": base_type}
-                            ),
-                        }
-                    )._convert(state)[:-5]
-                    + (rule or "None")
-                    + "]"
-                )
-                base_type = new_type
-        state.base_type_aliases[name] = base_type
+    elif isinstance(base_type, tuple):
+        base_type, rule = base_type
+        if state._in_complex and type.startswith("xsd:"):
+            new_type: str
+            state.simple_types[new_type] = (
+                XSDSimpleType.model_construct(
+                    name=(new_type := type[4:]),
+                    restriction=XSDRestriction.model_construct(base=base_type),
+                )._convert(state)[:-5]
+                + (rule or "None")
+                + "]"
+            )
+            base_type = new_type
     if base_type.startswith("datetime."):
         state.imports.add("datetime")
-    return base_type, rule
+    return base_type, rule, is_alias
 
 
 def _docstring(